@@ -0,0 +1,314 @@
+# import libraries
+import numpy as np
+import warnings
+from multiprocessing import Pool
+from Prob_absorb_to_each import prob_reach_absorb, prob_reach_absorb_Hughes
+from Time_absorb_wild_states import mixed_state_dicts, solve_absorb_time
+
+# exact solvers for the probability of reaching an absorbing state for each model
+solvers = {'3 mosquito': prob_reach_absorb,
+           'Hughes': prob_reach_absorb_Hughes}
+
+# parameters used by the transition rates of each model
+rate_params = {'3 mosquito': ('b1', 'b2', 'K', 'd1', 'd2'),
+               'Hughes': ('b1', 'd1', 'd2', 'v', 'phi', 'u', 'h', 'k')}
+
+# parameters which can be varied by the emulator for each model, for the 3 mosquito model the Wolbachia birth rate
+# is recomputed as b2 = b1*phi, and h, k are not included as b1 is derived from them in the notebooks
+varied_params = {'3 mosquito': ('phi', 'b1', 'K', 'd1', 'd2'),
+                 'Hughes': ('phi', 'u', 'v', 'b1', 'd1', 'd2')}
+
+
+# default tolerances for falling back to the exact solver, absolute for the invasion probability and relative for the expected time
+default_tol = {'prob': 0.02, 'time': 0.02}
+
+
+def derived_params(model, names):
+    '''Returns the parameters recomputed from the varied parameters given.'''
+    if model == '3 mosquito' and ('phi' in names or 'b1' in names):
+        return ('b2',)   # Wolbachia per capita birth rate b2 = b1*phi
+    return ()
+
+
+def latin_hypercube(n_samples, n_dims, n_tries=20, seed=None):
+    '''Returns a space-filling Latin hypercube design on the unit cube, keeping the design with the largest minimum distance between points.'''
+    rng = np.random.default_rng(seed)   # random number generator
+    best, best_dist = None, -1
+    for _ in range(n_tries):    # looping over candidate designs
+        # one point in each of the n_samples strata along every dimension, randomly paired across dimensions
+        X = np.column_stack([(rng.permutation(n_samples) + rng.random(n_samples))/n_samples for _ in range(n_dims)])
+        if n_tries == 1:   # nothing to compare against
+            return X
+        dists = np.sqrt(np.sum((X[:,None,:] - X[None,:,:])**2, axis=2))  # distances between all design points
+        min_dist = np.min(dists[np.triu_indices(n_samples, 1)]) if n_samples > 1 else 0
+        if min_dist > best_dist:   # keep the design with points furthest apart (maximin)
+            best, best_dist = X, min_dist
+    return best   # return design
+
+
+def exact_invasion(values, names, params_dict, max_pop, model='Hughes', with_time=True):
+    '''Returns the invasion probability (and expected time to invasion) from each mixed state for the parameter values given, using the exact solver.'''
+    p = dict(params_dict)              # copy the base parameter dictionary
+    p.update(zip(names, values))       # overwrite the parameters being varied
+    if 'b2' in derived_params(model, names):
+        p['b2'] = p['b1']*p['phi']     # Wolbachia per capita birth rate
+    state_dict, trans_dict = mixed_state_dicts(max_pop)
+    n_transient = len(trans_dict)      # number of transient states i.e. mixed
+
+    prob_reach_wolb = np.zeros(n_transient)  # initialise an array to hold all the probabilities for the mixed states
+    for i in range(max_pop):                 # looping over the Wolbachia-only state space
+        absorb_state = np.array([0,i+1])     # current Wolbachia-only state (absorbing state)
+        ac, Qcc = solvers[model](state_dict,trans_dict,absorb_state,p)
+        prob_reach_wolb[:] += np.transpose(ac)[0]
+
+    if with_time:   # finding the expected invasion times, reusing the probabilities above
+        invade_time = solve_absorb_time(prob_reach_wolb,Qcc,np.ones(n_transient))
+    else:
+        invade_time = None
+    return prob_reach_wolb, invade_time   # return probabilities and expected times
+
+
+def run_exact(X, names, bounds, params_dict, max_pop, model='Hughes', with_time=True, processes=None):
+    '''Runs the exact solver at each design point (on the unit cube) in parallel and returns the stacked probabilities and expected times.'''
+    args = [(to_params(x, bounds), names, params_dict, max_pop, model, with_time) for x in X]
+    with Pool(processes) as pool:   # one exact solve per worker
+        results = pool.starmap(exact_invasion, args)
+    probs = np.array([r[0] for r in results])
+    times = np.array([r[1] for r in results]) if with_time else None
+    return probs, times   # return arrays of shape (number of design points, number of mixed states)
+
+
+def to_params(x, bounds):
+    '''Maps a point on the unit cube to parameter values within the bounds given.'''
+    return bounds[:,0] + x*(bounds[:,1] - bounds[:,0])
+
+
+def to_unit(values, bounds):
+    '''Maps parameter values within the bounds given to a point on the unit cube.'''
+    return (values - bounds[:,0])/(bounds[:,1] - bounds[:,0])
+
+
+def kernel(X1, X2, length):
+    '''Returns the squared exponential covariance matrix between two sets of points.'''
+    sq_dist = np.sum((X1[:,None,:] - X2[None,:,:])**2, axis=2)
+    return np.exp(-0.5*sq_dist/length**2)
+
+
+def fit_gp(X, Y, lengths=np.logspace(-1.5, 1.5, 31), nugget=1e-6):
+    '''Fits a Gaussian process emulator (shared squared exponential correlation) to each column of Y, choosing the length scale and
+    the signal variance of each column by maximum marginal likelihood.'''
+    mean = np.mean(Y, axis=0)               # centre each output
+    scale = np.std(Y, axis=0)
+    scale[scale < 1e-12] = 1                # outputs which do not vary are left unscaled
+    Z = (Y - mean)/scale                    # normalised outputs
+    n, n_out = Z.shape
+
+    best = None
+    while best is None:
+        for length in lengths:   # looping over candidate length scales
+            K = kernel(X, X, length) + nugget*np.eye(n)
+            try:
+                L = np.linalg.cholesky(K)
+            except np.linalg.LinAlgError:   # covariance matrix numerically singular
+                continue
+            alpha = np.linalg.solve(L.T, np.linalg.solve(L, Z))
+            # maximum likelihood signal variance of each normalised output
+            amp = np.maximum(np.sum(Z*alpha, axis=0)/n, 1e-12)
+            # log marginal likelihood summed over all outputs, with the signal variances profiled out
+            lml = -0.5*n*np.sum(np.log(amp)) - n_out*np.sum(np.log(np.diag(L)))
+            if best is None or lml > best[0]:
+                best = (lml, length, L, alpha, amp)
+        if best is None:   # singular for every length scale, so increase the nugget
+            if nugget >= 1e-2:
+                raise np.linalg.LinAlgError('covariance matrix is singular for every length scale, check for duplicated training points')
+            nugget *= 10
+
+    lml, length, L, alpha, amp = best
+    if len(lengths) > 1 and length in (np.min(lengths), np.max(lengths)):
+        warnings.warn(f'length scale {length:.3g} is at the edge of the search grid, widen lengths')
+    L_inv = np.linalg.solve(L, np.eye(n))
+    return {'length': length, 'nugget': nugget, 'mean': mean, 'scale': scale, 'amp': amp,
+            'alpha': alpha, 'K_inv': L_inv.T @ L_inv}   # return fitted emulator
+
+
+def predict_gp(gp, X_train, x, cols=slice(None)):
+    '''Returns the emulator prediction and its standard error at the point x (on the unit cube) for the output columns given.'''
+    k = np.exp(-0.5*np.sum((X_train - x)**2, axis=1)/gp['length']**2)   # covariance with training points
+    var = max(1 - k @ gp['K_inv'] @ k, 0)       # predictive variance relative to the signal variance, shared by all outputs
+    mu = gp['mean'][cols] + gp['scale'][cols]*(k @ gp['alpha'][:,cols])
+    err = gp['scale'][cols]*np.sqrt(gp['amp'][cols]*var)
+    return mu, err   # return prediction and standard error
+
+
+def refine_points(emulator, n_points, levels=(0.5, 0.9), n_candidates=2000, seed=None):
+    '''Returns the candidate points (on the unit cube) where the invasion probability of some mixed state is least certain to lie above or below the given contour levels.'''
+    X = emulator['X']
+    n_dims = X.shape[1]
+    candidates = latin_hypercube(n_candidates, n_dims, n_tries=1, seed=seed)
+    gp = emulator['prob']
+    K_c = kernel(candidates, X, gp['length'])     # covariance between candidates and training points
+    var = np.maximum(1 - np.sum((K_c @ gp['K_inv'])*K_c, axis=1), 1e-12)
+    mu = gp['mean'] + gp['scale']*(K_c @ gp['alpha'])
+    err = gp['scale']*np.sqrt(gp['amp']*var[:,None])
+    err[err < 1e-12] = 1e-12
+    # number of standard errors between the prediction and the nearest contour, for the most uncertain mixed state
+    score = np.min(np.min([np.abs(mu - level)/err for level in levels], axis=0), axis=1)
+
+    # keep the new points spread out, and away from the existing training points
+    min_dist = 0.5/(len(X) + n_points)**(1/n_dims)
+    far = np.min(np.sqrt(np.sum((candidates[:,None,:] - X[None,:,:])**2, axis=2)), axis=1) > min_dist
+    chosen = []
+    for i in np.argsort(score):   # looping from the least certain candidate
+        if far[i] and all(np.linalg.norm(candidates[i] - candidates[j]) > min_dist for j in chosen):
+            chosen.append(i)
+        if len(chosen) == n_points:
+            break
+    return candidates[chosen]   # return new design points
+
+
+def train_emulator(params_dict, bounds, max_pop, n_initial=40, n_rounds=3, n_refine=10,
+                   levels=(0.5, 0.9), model='Hughes', with_time=True, processes=None, seed=None):
+    '''Trains emulators for the invasion probability and expected time to invasion from each mixed state over the parameter ranges given in bounds,
+    e.g. bounds = {'phi': (0.7,1), 'u': (0.8,1), 'v': (0.8,1)}, with adaptive refinement near the contour levels.
+    The parameters which can be varied are phi, u, v, b1, d1, d2 for the Hughes model and phi, b1, K, d1, d2 for the 3 mosquito model
+    (where b2 = b1*phi is recomputed). The household size max_pop is fixed.'''
+    if model not in solvers:
+        raise ValueError(f"unknown model '{model}', must be one of {list(solvers)}")
+    names = list(bounds)                                  # names of the parameters being varied
+    unsupported = [name for name in names if name not in varied_params[model]]
+    if unsupported:
+        raise ValueError(f"parameters {unsupported} cannot be varied for the {model} model, must be from {varied_params[model]}")
+    bounds_arr = np.array([bounds[name] for name in names], dtype=float)
+
+    X = latin_hypercube(n_initial, len(names), seed=seed)   # initial space-filling design
+    probs, times = run_exact(X, names, bounds_arr, params_dict, max_pop, model, with_time, processes)
+    emulator = {'names': names, 'bounds': bounds_arr, 'params_dict': dict(params_dict),
+                'max_pop': max_pop, 'model': model, 'X': X, 'probs': probs, 'times': times}
+    emulator['prob'] = fit_gp(X, probs)
+
+    for r in range(n_rounds):   # adaptive refinement near the contours
+        X_new = refine_points(emulator, n_refine, levels, seed=None if seed is None else seed + r + 1)
+        probs_new, times_new = run_exact(X_new, names, bounds_arr, params_dict, max_pop, model, with_time, processes)
+        emulator['X'] = np.vstack((emulator['X'], X_new))
+        emulator['probs'] = np.vstack((emulator['probs'], probs_new))
+        if with_time:
+            emulator['times'] = np.vstack((emulator['times'], times_new))
+        emulator['prob'] = fit_gp(emulator['X'], emulator['probs'])
+
+    emulator['time'] = fit_gp(emulator['X'], emulator['times']) if with_time else None
+    emulator['state_index'] = {tuple(state): key for key, state in mixed_state_dicts(max_pop)[1].items()}
+    return emulator   # return trained emulator
+
+
+def save_emulator(emulator, filename):
+    '''Saves the training data of the emulator to a .npz file, adding the .npz extension if missing.'''
+    if not filename.endswith('.npz'):
+        filename += '.npz'
+    names = emulator['names']
+    np.savez(filename, names=np.array(names), bounds=emulator['bounds'],
+             param_names=np.array(list(emulator['params_dict'])),
+             param_values=np.array(list(emulator['params_dict'].values()), dtype=float),
+             max_pop=emulator['max_pop'], model=emulator['model'], X=emulator['X'], probs=emulator['probs'],
+             times=emulator['times'] if emulator['times'] is not None else np.zeros((0,0)),
+             length_prob=emulator['prob']['length'], nugget_prob=emulator['prob']['nugget'],
+             length_time=emulator['time']['length'] if emulator['time'] is not None else 0,
+             nugget_time=emulator['time']['nugget'] if emulator['time'] is not None else 0)
+
+
+def load_emulator(filename):
+    '''Loads an emulator saved by save_emulator, rebuilding the fitted Gaussian processes. The .npz extension is added if missing.'''
+    if not filename.endswith('.npz'):
+        filename += '.npz'
+    data = np.load(filename)
+    X, probs, times = data['X'], data['probs'], data['times']
+    max_pop = int(data['max_pop'])
+    emulator = {'names': [str(name) for name in data['names']], 'bounds': data['bounds'],
+                'params_dict': {str(name): float(value) for name, value in zip(data['param_names'], data['param_values'])},
+                'max_pop': max_pop, 'model': str(data['model']), 'X': X, 'probs': probs,
+                'times': times if times.size else None}
+    # refit at the saved length scales and nuggets, so no search is needed
+    emulator['prob'] = fit_gp(X, probs, lengths=[float(data['length_prob'])], nugget=float(data['nugget_prob']))
+    emulator['time'] = fit_gp(X, times, lengths=[float(data['length_time'])], nugget=float(data['nugget_time'])) if times.size else None
+    emulator['state_index'] = {tuple(state): key for key, state in mixed_state_dicts(max_pop)[1].items()}
+    return emulator   # return emulator
+
+
+def check_params(emulator, params):
+    '''Returns the values of the emulated parameters from params, raising a ValueError if any other parameter used by the model differs from
+    the value the emulator was trained with.'''
+    missing = [name for name in emulator['names'] if name not in params]
+    if missing:
+        raise ValueError(f'missing emulated parameters {missing}')
+    for name in rate_params[emulator['model']]:   # looping over the parameters the model uses
+        if name in emulator['names'] or name in derived_params(emulator['model'], emulator['names']) or name not in params:
+            continue
+        if not np.isclose(params[name], emulator['params_dict'][name]):
+            raise ValueError(f"parameter '{name}' = {params[name]} differs from the value {emulator['params_dict'][name]} "
+                             f"the emulator was trained with, and is not one of the emulated parameters {emulator['names']}")
+    return np.array([params[name] for name in emulator['names']], dtype=float)   # return emulated parameter values
+
+
+def in_bounds(emulator, values):
+    '''Returns whether the emulated parameter values lie within the ranges the emulator was trained over.'''
+    return bool(np.all((values >= emulator['bounds'][:,0]) & (values <= emulator['bounds'][:,1])))
+
+
+def query_invasion(emulator, params, state, tol=None, quantity='prob'):
+    '''Returns the emulated invasion probability (quantity='prob') or expected time to invasion (quantity='time') from the initial state (m,w),
+    its standard error and whether the exact solver was used. Falls back to the exact solver if the standard error exceeds tol, which is
+    absolute for the invasion probability (default 0.02) and relative to the predicted time for the expected time (default 0.02, i.e. 2%).
+    The exact solver is always used for parameter values outside the ranges the emulator was trained over.
+    Any other parameter in params used by the model must match the value the emulator was trained with.'''
+    if quantity not in ('prob', 'time'):
+        raise ValueError(f"quantity must be 'prob' or 'time', not '{quantity}'")
+    if emulator[quantity] is None:
+        raise ValueError('no expected time to invasion emulator, train with with_time=True')
+    values = check_params(emulator, params)
+    m, w = state
+    if m < 0 or w < 0 or m + w > emulator['max_pop']:
+        raise ValueError(f"state {(m, w)} is not in the state space for max_pop = {emulator['max_pop']}")
+    if w == 0:   # wild-type-only states and extinction (0,0), invasion is impossible
+        return (0.0 if quantity == 'prob' else np.inf), 0.0, False
+    if m == 0:   # Wolbachia-only states, invasion has already happened
+        return (1.0 if quantity == 'prob' else 0.0), 0.0, False
+
+    indx = emulator['state_index'][(m, w)]    # index of the mixed state
+    if in_bounds(emulator, values):   # only emulate within the parameter ranges trained over
+        mu, err = predict_gp(emulator[quantity], emulator['X'], to_unit(values, emulator['bounds']), indx)
+        if quantity == 'prob':
+            mu = np.clip(mu, 0, 1)   # keep the emulated probability within [0,1]
+        if tol is None:
+            tol = default_tol[quantity]
+        # the error in the expected time is compared relative to the predicted time
+        tol_abs = tol if quantity == 'prob' else tol*abs(mu)
+        if err <= tol_abs:
+            return float(mu), float(err), False
+
+    # outside the parameter ranges or predicted error too large, so solve exactly
+    probs, times = exact_invasion(values, emulator['names'], emulator['params_dict'], emulator['max_pop'],
+                                  emulator['model'], with_time=(quantity == 'time'))
+    exact = probs if quantity == 'prob' else times
+    return float(exact[indx]), 0.0, True
+
+
+def min_release(emulator, params, m, level=0.9, tol=None):
+    '''Returns the smallest number of Wolbachia-infected mosquitoes, and the corresponding proportion, giving invasion probability >= level
+    from a household with m wild-types. Returns None if no such state exists. States whose emulated probability is within one standard
+    error of level, or parameter values outside the ranges trained over, are checked with the exact solver.'''
+    values = check_params(emulator, params)
+    exact_probs = None   # exact invasion probabilities, only computed if needed
+    if m > 0 and not in_bounds(emulator, values):
+        exact_probs = exact_invasion(values, emulator['names'], emulator['params_dict'], emulator['max_pop'],
+                                     emulator['model'], with_time=False)[0]
+    for w in range(1, emulator['max_pop'] - m + 1):    # looping over the Wolbachia-infected values
+        if exact_probs is None:
+            prob, err, exact = query_invasion(emulator, params, (m, w), tol)
+        if exact_probs is None and prob - err < level <= prob + err:
+            # the emulator cannot tell which side of level the state lies, so solve exactly
+            exact_probs = exact_invasion(values, emulator['names'], emulator['params_dict'], emulator['max_pop'],
+                                         emulator['model'], with_time=False)[0]
+        if exact_probs is not None and m > 0:
+            prob = exact_probs[emulator['state_index'][(m, w)]]
+        if prob >= level:
+            return w, w/(m + w)   # return number and proportion of Wolbachia-infected required
+    return None